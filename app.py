@@ -1,17 +1,31 @@
 import os
+import hashlib
 import logging
+import secrets
+import socket
+import orjson
 import requests
 import threading
-import time
+import click
 from functools import wraps
 from datetime import datetime, timedelta
+from urllib.parse import urlsplit
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, g
+from flask.json.provider import JSONProvider
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_caching import Cache
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from sqlalchemy import func, insert, or_
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import NullPool
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from camera_broadcaster import CameraBroadcaster
+from http_session import make_session
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
@@ -22,9 +36,24 @@ db = SQLAlchemy(model_class=Base)
 
 # Create the app
 app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+app.secret_key = os.environ.get("SESSION_SECRET")
+if not app.secret_key:
+    # Sessions signed with a random key don't survive restarts or span worker processes
+    logging.warning("SESSION_SECRET is not set, using a random session key")
+    app.secret_key = secrets.token_hex(32)
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson for the API endpoints"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = OrjsonProvider(app)
+
 # Database configuration
 database_url = os.environ.get("DATABASE_URL")
 if database_url and database_url.startswith("postgres://"):
@@ -32,16 +61,33 @@ if database_url and database_url.startswith("postgres://"):
     database_url = database_url.replace("postgres://", "postgresql://", 1)
 
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url or 'sqlite:///instance/User.db'
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    # SQLite connections are cheap to open and don't share well between threads
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        "poolclass": NullPool,
+    }
+else:
+    # Sized for many concurrent viewers and pollers; LIFO keeps recently used connections warm
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+        "pool_size": 20,
+        "max_overflow": 40,
+        "pool_timeout": 5,
+        "pool_use_lifo": True,
+    }
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'dataset'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+USERS_PER_PAGE = 50  # Rows per page in the admin users table
+
 # Initialize the app with the extension
 db.init_app(app)
+cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache', 'CACHE_DEFAULT_TIMEOUT': 60})
+
+# Shared HTTP session so status checks and ngrok calls reuse pooled connections
+SESSION = make_session(pool_connections=10, pool_maxsize=50, backoff_factor=0.1)
 
 # Global variables for camera stream management
 current_stream_url = None
@@ -50,6 +96,31 @@ esp32_ip = os.environ.get("ESP32_IP", "192.168.29.115")
 # For deployment, the proxy won't be available locally
 local_proxy_url = "http://localhost:8000"
 is_deployed = os.environ.get("REPL_ID") is not None  # Check if running on Replit
+# Set whenever the stream configuration changes to wake the status monitor
+status_changed = threading.Event()
+# Guards current_stream_url and camera_status so readers see a consistent pair
+stream_lock = threading.Lock()
+
+def _canonical(url):
+    """Return the (base URL, stream URL) pair for a registered ngrok URL"""
+    parts = urlsplit(url.strip())
+    if not parts.netloc:
+        # No scheme given, e.g. "abc123.ngrok.io"
+        parts = urlsplit(f"https://{url.strip()}")
+    base_url = f"{parts.scheme}://{parts.netloc}"
+    return base_url, f"{base_url}/stream"
+
+def set_stream_url(stream_url, status):
+    """Update the registered stream URL and camera status together"""
+    global current_stream_url, camera_status
+    with stream_lock:
+        changed = stream_url != current_stream_url
+        current_stream_url = stream_url
+        camera_status = status
+    status_changed.set()
+    if changed:
+        # Move viewers already watching over to the new source
+        stream_broadcaster.restart()
 
 # User model
 class User(db.Model):
@@ -60,7 +131,56 @@ class User(db.Model):
     role = db.Column(db.String(20), nullable=False, default='student')
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
 
-# Authentication decorator
+# Password hashing, argon2 with legacy werkzeug hashes upgraded on login
+# OWASP's argon2id baseline (19 MiB, 2 passes). Every login allocates memory_cost KiB,
+# and with 32 threads per worker on a 0.5 GB deploy 64 MiB would OOM under a login burst
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+def hash_password(password):
+    """Hash a password for storage"""
+    return password_hasher.hash(password)
+
+def verify_password(user, password):
+    """Check a user's password, rehashing it with the current parameters if needed"""
+    if user.password_hash.startswith('$argon2'):
+        try:
+            password_hasher.verify(user.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        if not password_hasher.check_needs_rehash(user.password_hash):
+            return True
+    elif not check_password_hash(user.password_hash, password):
+        return False
+
+    user.password_hash = hash_password(password)
+    db.session.commit()
+    return True
+
+# Attendance model, one row per student per marking
+class Attendance(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    date = db.Column(db.Date, nullable=False)
+    time_in = db.Column(db.Time)
+    time_out = db.Column(db.Time)
+    status = db.Column(db.String(20), default='present')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_att_student_date', 'student_id', 'date'),)
+
+@cache.memoize(timeout=60)
+def get_user(user_id):
+    """Look up a user by id, cached so each request doesn't hit the database"""
+    return User.query.get(user_id)
+
+def current_user():
+    """The logged-in user, looked up at most once per request"""
+    if 'user' not in g:
+        user_id = session.get('user_id')
+        g.user = get_user(user_id) if user_id is not None else None
+    return g.user
+
+# Authentication decorator, only checks the session so polling routes never load the user
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -73,10 +193,10 @@ def role_required(role):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if 'user_id' not in session:
+            user = current_user()
+            if user is None:
                 return redirect(url_for('login'))
-            user = User.query.get(session['user_id'])
-            if not user or user.role != role:
+            if user.role != role:
                 flash('Access denied. Insufficient permissions.', 'error')
                 return redirect(url_for('dashboard'))
             return f(*args, **kwargs)
@@ -86,21 +206,31 @@ def role_required(role):
 # Camera status monitoring
 def monitor_camera_status():
     global camera_status
+    interval = 30
     while True:
+        # Sleep until the next check is due or the stream configuration changes
+        status_changed.wait(timeout=interval)
+        status_changed.clear()
+        if current_stream_url:
+            # A registered ngrok stream owns the status until it is cleared
+            continue
         try:
-            response = requests.get(f"http://{esp32_ip}:81/", timeout=5)
-            if response.status_code == 200:
-                camera_status = "Connected"
-            else:
-                camera_status = "Error"
-        except requests.exceptions.RequestException:
-            camera_status = "Disconnected"
-        except Exception as e:
-            logging.error(f"Camera monitoring error: {e}")
-            camera_status = "Error"
-        time.sleep(30)  # Check every 30 seconds
+            # A TCP connect proves the camera is up without making it render a page
+            with socket.create_connection((esp32_ip, 81), timeout=2):
+                status = "Connected"
+        except OSError:
+            status = "Disconnected"
+        
+        # Check every 30 seconds, backing off up to 5 minutes while the camera is down
+        interval = 30 if status == "Connected" else min(interval * 2, 300)
+        
+        with stream_lock:
+            # Don't overwrite a stream registered while the probe was running
+            if not current_stream_url:
+                camera_status = status
 
-# Start camera monitoring in background
+# Start camera monitoring in background, with an immediate first check
+status_changed.set()
 camera_monitor_thread = threading.Thread(target=monitor_camera_status, daemon=True)
 camera_monitor_thread.start()
 
@@ -119,10 +249,8 @@ def login():
         
         user = User.query.filter_by(username=username).first()
         
-        if user and check_password_hash(user.password_hash, password):
+        if user and verify_password(user, password):
             session['user_id'] = user.id
-            session['username'] = user.username
-            session['role'] = user.role
             flash('Login successful!', 'success')
             return redirect(url_for('dashboard'))
         else:
@@ -139,19 +267,22 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    user = User.query.get(session['user_id'])
+    user = current_user()
     if not user:
         return redirect(url_for('login'))
     
     if user.role == 'admin':
-        users = User.query.all()
+        # Count users per role in the database instead of loading every row
+        counts = dict(db.session.query(User.role, func.count()).group_by(User.role).all())
         stats = {
-            'total_users': len(users),
-            'admins': len([u for u in users if u.role == 'admin']),
-            'teachers': len([u for u in users if u.role == 'teacher']),
-            'students': len([u for u in users if u.role == 'student'])
+            'total_users': sum(counts.values()),
+            'admins': counts.get('admin', 0),
+            'teachers': counts.get('teacher', 0),
+            'students': counts.get('student', 0)
         }
-        return render_template('admin_dashboard.html', user=user, users=users, stats=stats, camera_status=camera_status)
+        users = User.query.order_by(User.id).paginate(per_page=USERS_PER_PAGE, error_out=False)
+        return render_template('admin_dashboard.html', user=user, users=users.items, pagination=users,
+                               stats=stats, camera_status=camera_status)
     elif user.role == 'teacher':
         students = User.query.filter_by(role='student').all()
         return render_template('teacher_dashboard.html', user=user, students=students, camera_status=camera_status)
@@ -167,17 +298,18 @@ def create_user():
         password = request.form['password']
         role = request.form['role']
         
-        # Check if user already exists
-        if User.query.filter_by(username=username).first():
-            flash('Username already exists!', 'error')
-            return redirect(url_for('create_user'))
-        
-        if User.query.filter_by(email=email).first():
-            flash('Email already exists!', 'error')
+        # Check if user already exists, username and email in one query
+        existing = db.session.query(User.username, User.email).filter(
+            or_(User.username == username, User.email == email)).first()
+        if existing:
+            if existing.username == username:
+                flash('Username already exists!', 'error')
+            else:
+                flash('Email already exists!', 'error')
             return redirect(url_for('create_user'))
         
         # Create new user
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
         new_user = User()
         new_user.username = username
         new_user.email = email
@@ -187,14 +319,12 @@ def create_user():
         try:
             db.session.add(new_user)
             db.session.commit()
+            cache.delete_memoized(get_user, new_user.id)
             
             # Create dataset folder
             user_folder = os.path.join(app.config['UPLOAD_FOLDER'], username)
             os.makedirs(user_folder, exist_ok=True)
             
-            # Create attendance table for the user
-            create_attendance_table(username)
-            
             flash(f'User {username} created successfully!', 'success')
             return redirect(url_for('dashboard'))
         except Exception as e:
@@ -209,27 +339,41 @@ def mark_attendance():
     students = User.query.filter_by(role='student').all()
     
     if request.method == 'POST':
-        student_username = request.form['student']
-        status = request.form['status']
-        date = request.form['date']
+        if request.is_json:
+            # Batch marking: [{"student": ..., "status": ..., "date": ...}, ...]
+            records = request.get_json()
+        else:
+            # The form marks every selected student with the same status and date
+            records = [{'student': username, 'status': request.form['status'], 'date': request.form['date']}
+                       for username in request.form.getlist('student')]
         
         try:
-            # Insert attendance record
-            table_name = f"attendance_{student_username}"
-            query = f"""
-                INSERT INTO {table_name} (date, status, created_at)
-                VALUES (:date, :status, :created_at)
-            """
-            db.session.execute(db.text(query), {
-                'date': date, 
-                'status': status, 
-                'created_at': datetime.utcnow()
-            })
+            student_ids = {student.username: student.id for student in students}
+            created_at = datetime.utcnow()
+            rows = []
+            for record in records:
+                if record['student'] not in student_ids:
+                    raise ValueError(f"Unknown student {record['student']}")
+                rows.append({
+                    'student_id': student_ids[record['student']],
+                    'date': datetime.strptime(record['date'], '%Y-%m-%d').date(),
+                    'status': record['status'],
+                    'created_at': created_at
+                })
+            if not rows:
+                raise ValueError("No students selected")
+            
+            # Insert all attendance records in a single executemany
+            db.session.execute(insert(Attendance), rows)
             db.session.commit()
             
-            flash(f'Attendance marked for {student_username}', 'success')
+            if request.is_json:
+                return jsonify({'status': 'success', 'marked': len(rows)})
+            flash(f"Attendance marked for {', '.join(record['student'] for record in records)}", 'success')
         except Exception as e:
             db.session.rollback()
+            if request.is_json:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
             flash(f'Error marking attendance: {str(e)}', 'error')
     
     return render_template('mark_attendance.html', students=students)
@@ -238,33 +382,45 @@ def mark_attendance():
 @login_required
 def camera_stream():
     """Camera stream viewing page"""
-    user = User.query.get(session['user_id'])
+    user = current_user()
+    with stream_lock:
+        status, stream_url = camera_status, current_stream_url
     return render_template('camera_stream.html', user=user, 
-                         stream_url=current_stream_url, 
-                         camera_status=camera_status)
+                         stream_url=stream_url, 
+                         camera_status=status)
 
 @app.route('/api/camera_status')
 @login_required
 def api_camera_status():
     """API endpoint to get current camera status"""
-    return jsonify({
-        'status': camera_status,
-        'stream_url': current_stream_url,
-        'esp32_ip': esp32_ip
-    })
+    with stream_lock:
+        status, stream_url = camera_status, current_stream_url
+    
+    # Fingerprint the state so pollers that already have it get an empty 304
+    etag = hashlib.md5(f"{status}|{stream_url}".encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify({
+            'status': status,
+            'stream_url': stream_url,
+            'esp32_ip': esp32_ip
+        })
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = 5
+    return response
 
 @app.route('/api/update_camera_stream', methods=['POST'])
 def update_camera_stream():
     """API endpoint to update camera stream URL from ngrok proxy"""
-    global current_stream_url, camera_status
-    
     try:
         data = request.get_json()
-        if data and 'stream_url' in data:
-            current_stream_url = data['stream_url']
-            camera_status = "Connected via Ngrok"
-            logging.info(f"Camera stream URL updated: {current_stream_url}")
-            return jsonify({'status': 'success', 'message': 'Stream URL updated', 'url': current_stream_url})
+        if data and data.get('stream_url'):
+            _, stream_url = _canonical(data['stream_url'])
+            set_stream_url(stream_url, "Connected via Ngrok")
+            logging.info(f"Camera stream URL updated: {stream_url}")
+            return jsonify({'status': 'success', 'message': 'Stream URL updated', 'url': stream_url})
         else:
             return jsonify({'status': 'error', 'message': 'Invalid data'}), 400
     except Exception as e:
@@ -274,51 +430,43 @@ def update_camera_stream():
 @app.route('/api/register_ngrok', methods=['POST'])
 def register_ngrok():
     """Register a new ngrok URL for the camera stream"""
-    global current_stream_url, camera_status
-    
     try:
         data = request.get_json()
         ngrok_url = data.get('ngrok_url') if data else None
         
         if not ngrok_url:
             # Clear ngrok URL
-            current_stream_url = None
-            camera_status = "Disconnected"
+            set_stream_url(None, "Disconnected")
             
             # Clear from proxy server too (only if not deployed)
             if not is_deployed:
                 try:
-                    requests.post(f"{local_proxy_url}/set_external_url", 
-                                 json={'url': None}, timeout=5)
+                    SESSION.post(f"{local_proxy_url}/set_external_url", 
+                                json={'url': None}, timeout=5)
                 except:
                     pass
             
             return jsonify({'status': 'success', 'message': 'Ngrok URL cleared'})
         
         # Clean up the URL and set the stream endpoint
-        if ngrok_url.endswith('/'):
-            ngrok_url = ngrok_url[:-1]
-        if ngrok_url.endswith('/stream'):
-            ngrok_url = ngrok_url[:-7]
-        
-        current_stream_url = f"{ngrok_url}/stream"
-        camera_status = "Connected via Ngrok"
+        ngrok_url, stream_url = _canonical(ngrok_url)
+        set_stream_url(stream_url, "Connected via Ngrok")
         
         # Update the proxy server with the external URL (only if not deployed)
         if not is_deployed:
             try:
-                proxy_response = requests.post(f"{local_proxy_url}/set_external_url", 
-                                             json={'url': ngrok_url}, timeout=5)
+                proxy_response = SESSION.post(f"{local_proxy_url}/set_external_url", 
+                                            json={'url': ngrok_url}, timeout=5)
                 if proxy_response.status_code != 200:
                     logging.warning("Failed to update proxy server with external URL")
             except Exception as e:
                 logging.warning(f"Could not reach proxy server: {e}")
         
-        logging.info(f"Ngrok URL registered: {current_stream_url}")
+        logging.info(f"Ngrok URL registered: {stream_url}")
         return jsonify({
             'status': 'success', 
             'message': 'Ngrok URL registered successfully',
-            'stream_url': current_stream_url,
+            'stream_url': stream_url,
             'base_url': ngrok_url
         })
         
@@ -338,7 +486,7 @@ def auto_detect_ngrok():
     
     try:
         # Try to get ngrok tunnels from local ngrok API
-        response = requests.get("http://127.0.0.1:4040/api/tunnels", timeout=5)
+        response = SESSION.get("http://127.0.0.1:4040/api/tunnels", timeout=5)
         
         if response.status_code == 200:
             data = response.json()
@@ -349,29 +497,23 @@ def auto_detect_ngrok():
                     public_url = tunnel.get('public_url')
                     if public_url:
                         # Register this URL
-                        global current_stream_url, camera_status
-                        
-                        # Clean up URL
-                        if public_url.endswith('/'):
-                            public_url = public_url[:-1]
-                        
-                        current_stream_url = f"{public_url}/stream"
-                        camera_status = "Connected via Ngrok"
+                        public_url, stream_url = _canonical(public_url)
+                        set_stream_url(stream_url, "Connected via Ngrok")
                         
                         # Update the proxy server with the external URL
                         try:
-                            proxy_response = requests.post(f"{local_proxy_url}/set_external_url", 
-                                                         json={'url': public_url}, timeout=5)
+                            proxy_response = SESSION.post(f"{local_proxy_url}/set_external_url", 
+                                                        json={'url': public_url}, timeout=5)
                             if proxy_response.status_code != 200:
                                 logging.warning("Failed to update proxy server with external URL")
                         except Exception as e:
                             logging.warning(f"Could not reach proxy server: {e}")
                         
-                        logging.info(f"Auto-detected ngrok URL: {current_stream_url}")
+                        logging.info(f"Auto-detected ngrok URL: {stream_url}")
                         return jsonify({
                             'status': 'success',
                             'message': 'Ngrok tunnel auto-detected',
-                            'stream_url': current_stream_url,
+                            'stream_url': stream_url,
                             'base_url': public_url
                         })
             
@@ -393,7 +535,7 @@ def test_camera():
     
     # Test local proxy first
     try:
-        response = requests.get(f"{local_proxy_url}/status", timeout=3)
+        response = SESSION.get(f"{local_proxy_url}/status", timeout=3)
         if response.status_code == 200:
             results['local_proxy'] = {'status': 'success', 'message': 'Local proxy accessible'}
         else:
@@ -403,7 +545,7 @@ def test_camera():
     
     # Test direct ESP32 connection
     try:
-        response = requests.get(f"http://{esp32_ip}:81/", timeout=3)
+        response = SESSION.get(f"http://{esp32_ip}:81/", timeout=3)
         if response.status_code == 200:
             results['esp32_direct'] = {'status': 'success', 'message': 'ESP32 camera accessible'}
         else:
@@ -412,10 +554,11 @@ def test_camera():
         results['esp32_direct'] = {'status': 'error', 'message': f'ESP32 connection failed: {str(e)}'}
     
     # Test ngrok URL if available
-    if current_stream_url:
+    stream_url = current_stream_url
+    if stream_url:
         try:
-            test_url = current_stream_url.replace('/stream', '/status') if '/stream' in current_stream_url else f"{current_stream_url}/status"
-            response = requests.get(test_url, timeout=5)
+            test_url = f"{stream_url.removesuffix('/stream')}/status"
+            response = SESSION.get(test_url, timeout=5)
             results['ngrok'] = {'status': 'success' if response.status_code == 200 else 'error', 
                               'message': f'Ngrok tunnel accessible (status: {response.status_code})'}
         except requests.exceptions.RequestException as e:
@@ -425,63 +568,47 @@ def test_camera():
     
     return jsonify(results)
 
+def _stream_sources():
+    """Upstream stream URLs in order of preference: ngrok, local proxy, direct ESP32"""
+    sources = []
+    # If we have a registered ngrok URL, use it
+    stream_url = current_stream_url
+    if stream_url:
+        sources.append(stream_url)
+    # Local proxy and direct ESP32 only work when not deployed
+    if not is_deployed:
+        sources.append(f"{local_proxy_url}/stream")
+        sources.append(f"http://{esp32_ip}:81/stream")
+    return sources
+
+# Shared upstream readers, one per stream endpoint
+stream_broadcaster = CameraBroadcaster(_stream_sources)
+local_stream_broadcaster = CameraBroadcaster(lambda: [f"{local_proxy_url}/stream"])
+
+def _broadcast(broadcaster):
+    """Re-package frames from a shared broadcaster as a multipart response body"""
+    fresh = True
+    while True:
+        part = broadcaster.get_part(fresh=fresh)
+        fresh = False
+        if part is None:
+            # No stream available
+            yield b"--frame\r\nContent-Type: text/plain\r\n\r\nNo camera stream available. Please register an ngrok URL.\r\n"
+            return
+        yield part
+
 @app.route('/stream_proxy')
 @login_required
 def stream_proxy():
     """Proxy camera stream with multiple fallback options"""
-    global current_stream_url
-    
     try:
-        def generate():
-            # If we have a registered ngrok URL, use it
-            if current_stream_url:
-                try:
-                    logging.info(f"Trying registered stream: {current_stream_url}")
-                    response = requests.get(current_stream_url, stream=True, timeout=10,
-                                          headers={'User-Agent': 'UniSync-Camera-Stream/1.0'})
-                    if response.status_code == 200:
-                        for chunk in response.iter_content(chunk_size=1024):
-                            if chunk:
-                                yield chunk
-                        return
-                except Exception as e:
-                    logging.warning(f"Registered stream failed: {e}")
-            
-            # Try local proxy only if not deployed
-            if not is_deployed:
-                try:
-                    stream_url = f"{local_proxy_url}/stream"
-                    logging.info(f"Trying local proxy stream: {stream_url}")
-                    response = requests.get(stream_url, stream=True, timeout=5)
-                    if response.status_code == 200:
-                        for chunk in response.iter_content(chunk_size=1024):
-                            if chunk:
-                                yield chunk
-                        return
-                except Exception as e:
-                    logging.warning(f"Local proxy failed: {e}")
-            
-            # Fallback to direct ESP32 (only works locally)
-            if not is_deployed:
-                try:
-                    stream_url = f"http://{esp32_ip}:81/stream"
-                    logging.info(f"Trying direct ESP32 stream: {stream_url}")
-                    response = requests.get(stream_url, stream=True, timeout=5)
-                    for chunk in response.iter_content(chunk_size=1024):
-                        if chunk:
-                            yield chunk
-                    return
-                except Exception as e:
-                    logging.error(f"Direct ESP32 failed: {e}")
-            
-            # No stream available
-            yield b"--frame\r\nContent-Type: text/plain\r\n\r\nNo camera stream available. Please register an ngrok URL.\r\n"
-        
-        return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame',
+        return Response(_broadcast(stream_broadcaster), mimetype='multipart/x-mixed-replace; boundary=frame',
                        headers={
                            'Access-Control-Allow-Origin': '*',
-                           'Cache-Control': 'no-cache'
-                       })
+                           'Cache-Control': 'no-cache',
+                           'X-Accel-Buffering': 'no'
+                       },
+                       direct_passthrough=True)
     except Exception as e:
         logging.error(f"Stream proxy error: {e}")
         return Response(f"Stream error: {str(e)}", status=500)
@@ -491,37 +618,16 @@ def stream_proxy():
 def local_stream_proxy():
     """Proxy stream from local camera proxy server"""
     try:
-        def generate():
-            stream_url = f"{local_proxy_url}/stream"
-            response = requests.get(stream_url, stream=True, timeout=10)
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
-                    yield chunk
-        
-        return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+        return Response(_broadcast(local_stream_broadcaster), mimetype='multipart/x-mixed-replace; boundary=frame',
+                       headers={'X-Accel-Buffering': 'no'},
+                       direct_passthrough=True)
     except Exception as e:
         logging.error(f"Local stream proxy error: {e}")
         return Response(f"Local stream error: {str(e)}", status=500)
 
-def create_attendance_table(username):
-    """Create attendance table for a user"""
-    table_name = f"attendance_{username}"
-    query = f"""
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            id SERIAL PRIMARY KEY,
-            date DATE NOT NULL,
-            time_in TIME,
-            time_out TIME,
-            status VARCHAR(20) DEFAULT 'present',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """
-    db.session.execute(db.text(query))
-    db.session.commit()
-
 # Initialize database
-def init_database():
-    """Initialize database tables and create admin user"""
+def init_database(strict=False):
+    """Initialize database tables and create admin user, raising on failure if strict"""
     with app.app_context():
         try:
             db.create_all()
@@ -533,7 +639,7 @@ def init_database():
                 admin_user = User(
                     username='admin',
                     email='admin@unisync.edu',
-                    password_hash=generate_password_hash('admin123'),
+                    password_hash=hash_password('admin123'),
                     role='admin'
                 )
                 db.session.add(admin_user)
@@ -548,9 +654,18 @@ def init_database():
             
         except Exception as e:
             logging.error(f"Error initializing database: {e}")
-
-# Initialize on startup
-init_database()
+            if strict:
+                raise click.ClickException(f"Error initializing database: {e}") from e
+
+@app.cli.command('init-db')
+def init_db_cmd():
+    """Create the database tables and the default admin user"""
+    # Exit non-zero on failure so a deploy build step stops here
+    init_database(strict=True)
+
+# Initialize on startup only when asked to, deployments run `flask --app app init-db` once
+if os.environ.get('FLASK_INIT_DB'):
+    init_database()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,203 @@
+"""
+Camera Broadcaster
+Reads the MJPEG stream from the upstream source once and fans the
+frames out to every connected viewer
+"""
+import logging
+import threading
+import time
+from functools import lru_cache
+from threading import get_ident
+
+from http_session import make_session
+
+logger = logging.getLogger(__name__)
+
+# Dedicated session for long-lived upstream reads, kept apart from short API calls
+STREAM_SESSION = make_session(pool_connections=1, pool_maxsize=4, retries=0, pool_block=True)
+# JPEG frames are already compressed, so ask upstream not to gzip them
+_STREAM_REQUEST_HEADERS = {'User-Agent': 'UniSync-Camera-Stream/1.0', 'Accept-Encoding': 'identity'}
+
+
+class CameraEvent:
+    """An Event-like class that signals all active clients when a new frame is available"""
+
+    def __init__(self):
+        self.events = {}
+
+    def wait(self, timeout=None):
+        """Invoked from each client's thread to wait for the next frame"""
+        ident = get_ident()
+        if ident not in self.events:
+            # This is a new client, add an entry for it
+            self.events[ident] = [threading.Event(), time.time()]
+        return self.events[ident][0].wait(timeout)
+
+    def set(self):
+        """Invoked by the reader thread when a new frame is available"""
+        now = time.time()
+        remove = []
+        for ident, event in list(self.events.items()):
+            if not event[0].is_set():
+                # The client has consumed the previous frame, signal it
+                event[0].set()
+                event[1] = now
+            elif now - event[1] > 5:
+                # The client has not been reading for 5 seconds, assume it is gone
+                remove.append(ident)
+        for ident in remove:
+            self.events.pop(ident, None)
+
+    def clear(self):
+        """Invoked from each client's thread after a frame was processed"""
+        event = self.events.get(get_ident())
+        if event:
+            event[0].clear()
+
+
+class CameraBroadcaster:
+    """Shares a single upstream MJPEG connection between all viewers"""
+
+    idle_timeout = 10  # Stop reading upstream after this many seconds without viewers
+    retry_delay = 2  # Wait between rounds of failed upstream connection attempts
+    chunk_size = 65536  # Bytes read from the upstream per iteration
+
+    def __init__(self, sources):
+        # `sources` returns the upstream stream URLs to try, in order of preference
+        self.sources = sources
+        # The current frame wrapped as a multipart part, built once and shared by all viewers
+        self.part = None
+        self.event = CameraEvent()
+        self.last_access = 0
+        self.thread = None
+        self.lock = threading.Lock()
+        # Set when the sources change so the reader drops its current upstream
+        self.restart_requested = threading.Event()
+
+    def get_part(self, timeout=10, fresh=False):
+        """Return the next frame as a ready-to-send `--frame` multipart part, or None on timeout"""
+        if fresh:
+            # A viewer's first call: server threads are pooled, so drop any signal
+            # an earlier viewer on this thread left behind
+            self.event.clear()
+        if not self._wait(timeout):
+            return None
+        return self.part
+
+    def restart(self):
+        """Switch to the preferred source, e.g. after a new stream URL was registered"""
+        self.restart_requested.set()
+
+    def _wait(self, timeout):
+        self.last_access = time.time()
+        self._ensure_reader()
+
+        if not self.event.wait(timeout):
+            return False
+        self.event.clear()
+        return True
+
+    def _ensure_reader(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._reader, daemon=True)
+                self.thread.start()
+
+    def _idle(self):
+        return time.time() - self.last_access > self.idle_timeout
+
+    def _reader(self):
+        """Background thread that keeps the shared upstream connection open"""
+        try:
+            while True:
+                self.restart_requested.clear()
+                for url in self.sources():
+                    try:
+                        self._read_stream(url)
+                    except Exception as e:
+                        logger.warning("Upstream stream %s failed: %s", url, e)
+                    if self._idle() or self.restart_requested.is_set():
+                        break
+                else:
+                    self.restart_requested.wait(self.retry_delay)
+                with self.lock:
+                    # Decide to stop while holding the lock, so a viewer that arrives
+                    # now either keeps this thread going or starts a new one
+                    if self._idle():
+                        self._stop()
+                        break
+        except BaseException:
+            with self.lock:
+                self._stop()
+            raise
+        logger.info("Camera broadcaster stopped, no active viewers")
+
+    def _stop(self):
+        """Forget the reader, its last frame and its viewers; called with self.lock held"""
+        self.thread = None
+        self.part = None
+        self.event.events.clear()
+
+    def _read_stream(self, url):
+        """Read frames from a single upstream until it ends or the viewers leave"""
+        logger.info("Broadcasting stream from: %s", url)
+        response = STREAM_SESSION.get(url, stream=True, timeout=(3.05, 30),
+                                      headers=_STREAM_REQUEST_HEADERS)
+        try:
+            response.raise_for_status()
+            delimiter = _delimiter(response.headers.get('Content-Type', ''))
+
+            # Read the raw socket in large blocks, skipping requests' decoding layer.
+            # Frames are located with bytearray.find, so the scan runs in C and
+            # each byte is searched once even when a frame spans many reads.
+            buf = bytearray()
+            synced = False
+            scan_from = 0
+            for chunk in response.raw.stream(self.chunk_size, decode_content=False):
+                buf += chunk
+                if not synced:
+                    # Drop anything before the first delimiter
+                    start = buf.find(delimiter)
+                    if start < 0:
+                        del buf[:-len(delimiter)]
+                        continue
+                    del buf[:start]
+                    synced = True
+                    scan_from = len(delimiter)
+                while True:
+                    end = buf.find(delimiter, scan_from)
+                    if end < 0:
+                        # Resume after what was already scanned, allowing for a split delimiter
+                        scan_from = max(len(delimiter), len(buf) - len(delimiter) + 1)
+                        break
+                    self._publish(buf, len(delimiter), end)
+                    del buf[:end]
+                    scan_from = len(delimiter)
+                if self._idle() or self.restart_requested.is_set():
+                    return
+        finally:
+            response.close()
+
+    def _publish(self, buf, start, end):
+        """Publish the JPEG payload of the part held in buf[start:end]"""
+        # Skip the part headers and the CRLF that precedes the next delimiter
+        header_end = buf.find(b'\r\n\r\n', start, end)
+        if header_end < 0:
+            return
+        if buf[end - 2:end] == b'\r\n':
+            end -= 2
+        if end > header_end + 4:
+            frame = bytes(buf[header_end + 4:end])
+            self.part = b''.join((b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: ',
+                                  str(len(frame)).encode(), b'\r\n\r\n', frame, b'\r\n'))
+            self.event.set()
+
+
+@lru_cache(maxsize=8)
+def _delimiter(content_type):
+    """Part delimiter for a multipart Content-Type header, parsed once per distinct header"""
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.strip().partition('=')
+        if key.lower() == 'boundary':
+            return b'--' + value.strip('"').encode()
+    return b'--frame'
@@ -3,164 +3,178 @@ ESP32 Camera Proxy Server
 Runs on port 8000 to avoid conflicts with main Flask app
 Handles both local ESP32 and remote ngrok URLs
 """
-from flask import Flask, Response, jsonify, request
+from flask import Flask, Response, request
 from flask_cors import CORS
+import orjson
 import requests
 import logging
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from camera_broadcaster import CameraBroadcaster
+from http_session import make_session
+
+# Logging is configured when run as a script, see __main__ below
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.config['PROPAGATE_EXCEPTIONS'] = True
 CORS(app)  # Enable CORS for all routes
 
+# No retries: the /status probes must answer within their own timeout
+SESSION = make_session(retries=0)
+
+# Runs the /status liveness probes concurrently
+EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
 ESP32_IP = os.environ.get("ESP32_IP", "192.168.29.115")
-EXTERNAL_STREAM_URL = None  # For ngrok or other external URLs
+# External stream URL (ngrok) in a one-element list: readers load _ext[0],
+# set_external_url swaps it in a single assignment
+_ext = [None]
+
+# ESP32_IP never changes after startup, so build the URLs and headers once
+_ESP32_URL = f"http://{ESP32_IP}:81/"
+_ESP32_STREAM_URL = f"http://{ESP32_IP}:81/stream"
+# The broadcaster re-frames every upstream with its own boundary, so this never changes
+_STREAM_CONTENT_TYPE = 'multipart/x-mixed-replace; boundary=frame'
+_STREAM_RESP_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Cache-Control': 'no-cache'
+}
+
+# Test page for the proxy, ESP32_IP is fixed at startup so it's rendered once
+HOME_HTML_BYTES = (f'''
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>ESP32 Camera Proxy</title>
+        <style>
+            body {{ font-family: Arial, sans-serif; margin: 40px; }}
+            .container {{ max-width: 800px; margin: 0 auto; }}
+            img {{ max-width: 100%; border: 2px solid #ccc; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h1>ESP32 Camera Proxy</h1>
+            <p>ESP32 IP: {ESP32_IP}</p>
+            <p><a href="/status">Check Status</a> | <a href="/stream">View Stream</a></p>
+            
+            <h2>Live Stream</h2>
+            <img src="/stream" alt="ESP32 Camera Stream" onerror="this.src='data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iNDAwIiBoZWlnaHQ9IjMwMCIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj48cmVjdCB3aWR0aD0iNDAwIiBoZWlnaHQ9IjMwMCIgZmlsbD0iI2Y4ZjlmYSIvPjx0ZXh0IHg9IjUwJSIgeT0iNTAlIiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiM2Yzc1N2QiIHRleHQtYW5jaG9yPSJtaWRkbGUiIGR5PSIuM2VtIj5DYW1lcmEgVW5hdmFpbGFibGU8L3RleHQ+PC9zdmc+';">
+        </div>
+    </body>
+    </html>
+    ''').encode('utf-8')
+HOME_HEADERS = {
+    'Content-Type': 'text/html; charset=utf-8',
+    'Content-Length': str(len(HOME_HTML_BYTES))
+}
+
+def ojson(obj, status=200):
+    """JSON response encoded with orjson"""
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
+
+def _stream_sources():
+    """Upstream stream URLs in order of preference: external (ngrok), then local ESP32"""
+    external_url = _ext[0]
+    if external_url:
+        return [external_url, _ESP32_STREAM_URL]
+    return [_ESP32_STREAM_URL]
+
+# One upstream reader shared by every viewer of /stream
+broadcaster = CameraBroadcaster(_stream_sources)
+
+def _pump(part):
+    """Yield the shared multipart parts to one viewer until the stream stops"""
+    while part is not None:
+        yield part
+        part = broadcaster.get_part()
 
 @app.route('/stream')
 def stream():
     """Proxy the camera stream from ESP32 or external URL"""
-    global EXTERNAL_STREAM_URL
-    
     try:
-        # Try external stream URL first (ngrok)
-        if EXTERNAL_STREAM_URL:
-            try:
-                logging.info(f"Proxying external stream from: {EXTERNAL_STREAM_URL}")
-                response = requests.get(EXTERNAL_STREAM_URL, stream=True, timeout=10, 
-                                      headers={'User-Agent': 'UniSync-Camera-Proxy/1.0'})
-                
-                def generate():
-                    for chunk in response.iter_content(chunk_size=1024):
-                        if chunk:
-                            yield chunk
-                
-                return Response(
-                    generate(),
-                    content_type=response.headers.get('Content-Type', 'multipart/x-mixed-replace; boundary=frame'),
-                    headers={
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Headers': 'Content-Type',
-                        'Cache-Control': 'no-cache'
-                    }
-                )
-            except Exception as e:
-                logging.warning(f"External stream failed: {e}, falling back to local ESP32")
-        
-        # Fallback to local ESP32
-        stream_url = f"http://{ESP32_IP}:81/stream"
-        logging.info(f"Proxying local stream from: {stream_url}")
-        
-        response = requests.get(stream_url, stream=True, timeout=10)
+        # Wait for the first frame so an unreachable camera is reported up front
+        first_part = broadcaster.get_part(fresh=True)
+        if first_part is None:
+            logger.error("Stream error: no frames from ESP32 or external URL")
+            return Response("Stream unavailable: no frames received from the camera", status=503)
         
-        def generate():
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
-                    yield chunk
+        return Response(_pump(first_part), content_type=_STREAM_CONTENT_TYPE, headers=_STREAM_RESP_HEADERS)
         
-        return Response(
-            generate(),
-            content_type=response.headers.get('Content-Type', 'multipart/x-mixed-replace; boundary=frame'),
-            headers={
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Cache-Control': 'no-cache'
-            }
-        )
-        
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Stream error: {e}")
-        return Response(f"Stream unavailable: {str(e)}", status=503)
     except Exception as e:
-        logging.error(f"Unexpected error: {e}")
+        logger.error("Unexpected error: %s", e)
         return Response(f"Server error: {str(e)}", status=500)
 
 @app.route('/set_external_url', methods=['POST'])
 def set_external_url():
     """Set external stream URL (for ngrok)"""
-    global EXTERNAL_STREAM_URL
-    
     try:
-        data = request.get_json()
+        body = request.get_data(cache=False)
+        data = orjson.loads(body) if body else None
         url = data.get('url') if data else None
         
         if url:
-            # Clean up URL - remove trailing /stream if present
-            if url.endswith('/stream'):
-                url = url[:-7]
-            EXTERNAL_STREAM_URL = f"{url}/stream"
-            logging.info(f"External stream URL set to: {EXTERNAL_STREAM_URL}")
-            return jsonify({'status': 'success', 'external_url': EXTERNAL_STREAM_URL})
+            # Clean up URL - remove trailing slash and /stream if present
+            url = url.rstrip('/').removesuffix('/stream')
+            external_url = f"{url}/stream"
+            _ext[0] = external_url
+            broadcaster.restart()
+            logger.info("External stream URL set to: %s", external_url)
+            return ojson({'status': 'success', 'external_url': external_url})
         else:
-            EXTERNAL_STREAM_URL = None
-            logging.info("External stream URL cleared")
-            return jsonify({'status': 'success', 'external_url': None})
+            _ext[0] = None
+            broadcaster.restart()
+            logger.info("External stream URL cleared")
+            return ojson({'status': 'success', 'external_url': None})
             
     except Exception as e:
-        logging.error(f"Error setting external URL: {e}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        logger.error("Error setting external URL: %s", e)
+        return ojson({'status': 'error', 'message': str(e)}, status=500)
 
 @app.route('/status')
 def status():
     """Check camera status and configuration"""
-    global EXTERNAL_STREAM_URL
-    
+    external_url = _ext[0]
     status_info = {
         'esp32_ip': ESP32_IP,
-        'external_url': EXTERNAL_STREAM_URL,
+        'external_url': external_url,
         'timestamp': time.time()
     }
     
-    # Check local ESP32
-    try:
-        response = requests.get(f"http://{ESP32_IP}:81/", timeout=5)
-        status_info['esp32_status'] = 'online'
-        status_info['esp32_response_code'] = response.status_code
-    except requests.exceptions.RequestException as e:
-        status_info['esp32_status'] = 'offline'
-        status_info['esp32_error'] = str(e)
+    # Check local ESP32 and the external URL (if set) in parallel
+    probes = {EXECUTOR.submit(SESSION.head, _ESP32_URL, timeout=1.5): 'esp32'}
+    if external_url:
+        probes[EXECUTOR.submit(SESSION.head, external_url, timeout=1.5)] = 'external'
     
-    # Check external URL if set
-    if EXTERNAL_STREAM_URL:
+    for future in as_completed(probes):
+        name = probes[future]
         try:
-            response = requests.get(EXTERNAL_STREAM_URL, timeout=5)
-            status_info['external_status'] = 'online'
-            status_info['external_response_code'] = response.status_code
+            response = future.result()
+            status_info[f'{name}_status'] = 'online'
+            status_info[f'{name}_response_code'] = response.status_code
         except requests.exceptions.RequestException as e:
-            status_info['external_status'] = 'offline'
-            status_info['external_error'] = str(e)
+            status_info[f'{name}_status'] = 'offline'
+            status_info[f'{name}_error'] = str(e)
     
-    return jsonify(status_info)
+    return ojson(status_info)
 
 @app.route('/')
 def home():
     """Simple test page for the proxy"""
-    return f'''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>ESP32 Camera Proxy</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; margin: 40px; }}
-            .container {{ max-width: 800px; margin: 0 auto; }}
-            img {{ max-width: 100%; border: 2px solid #ccc; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>ESP32 Camera Proxy</h1>
-            <p>ESP32 IP: {ESP32_IP}</p>
-            <p><a href="/status">Check Status</a> | <a href="/stream">View Stream</a></p>
-            
-            <h2>Live Stream</h2>
-            <img src="/stream" alt="ESP32 Camera Stream" onerror="this.src='data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iNDAwIiBoZWlnaHQ9IjMwMCIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj48cmVjdCB3aWR0aD0iNDAwIiBoZWlnaHQ9IjMwMCIgZmlsbD0iI2Y4ZjlmYSIvPjx0ZXh0IHg9IjUwJSIgeT0iNTAlIiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiM2Yzc1N2QiIHRleHQtYW5jaG9yPSJtaWRkbGUiIGR5PSIuM2VtIj5DYW1lcmEgVW5hdmFpbGFibGU8L3RleHQ+PC9zdmc+';">
-        </div>
-    </body>
-    </html>
-    '''
+    return Response(HOME_HTML_BYTES, headers=HOME_HEADERS)
 
 if __name__ == '__main__':
-    logging.info(f"Starting ESP32 Camera Proxy for IP: {ESP32_IP}")
-    app.run(host='0.0.0.0', port=8000, debug=True)
+    # Quiet by default, CAMPROXY_DEBUG=1 turns on verbose logging
+    logging.basicConfig(level=logging.DEBUG if os.environ.get("CAMPROXY_DEBUG") == "1" else logging.WARNING)
+    # Printed rather than logged so it shows up at the default WARNING level
+    print(f"Starting ESP32 Camera Proxy for IP: {ESP32_IP}", flush=True)
+    if os.environ.get("CAMPROXY_PROD") == "1":
+        # Multi-threaded production server, so stream viewers don't block each other
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=8000, threads=16)
+    else:
+        app.run(host='0.0.0.0', port=8000, debug=True)
@@ -0,0 +1,17 @@
+"""
+Gunicorn configuration for UniSync
+Streaming viewers each hold a connection open for the whole session, so
+requests are served by threads instead of one process per connection
+"""
+import os
+
+bind = "0.0.0.0:5000"
+reuse_port = True
+
+# One process keeps a single shared camera broadcaster; threads serve the viewers
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 32))
+
+# Write each MJPEG chunk straight to the socket
+sendfile = False
@@ -0,0 +1,19 @@
+"""
+HTTP Session
+Pooled requests sessions shared by the app, the camera proxy and its helper scripts
+"""
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def make_session(pool_connections=4, pool_maxsize=16, retries=2, backoff_factor=0.05, pool_block=False):
+    """Return a session whose pooled keep-alive connections are used for both http and https"""
+    session = requests.Session()
+    # retries=0 fails on the first error, for probes that must answer within their timeout
+    max_retries = Retry(total=retries, backoff_factor=backoff_factor) if retries else 0
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                          max_retries=max_retries, pool_block=pool_block)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
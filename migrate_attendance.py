@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+One-time migration that copies the old per-student attendance_<username>
+tables into the shared attendance table. Each table is renamed to
+migrated_attendance_<username> (or dropped with --drop) in the same
+transaction as its copy, so a remaining attendance_ table is never migrated
+"""
+import sys
+from sqlalchemy import inspect
+from app import app, db, User
+
+MIGRATED_PREFIX = 'migrated_'
+
+def migrate_attendance_tables(drop=False):
+    """Copy rows from every attendance_<username> table into attendance, then rename or drop it"""
+    with app.app_context():
+        db.create_all()
+
+        preparer = db.engine.dialect.identifier_preparer
+        table_names = inspect(db.engine).get_table_names()
+        legacy_tables = [name for name in table_names if name.startswith('attendance_')]
+
+        if drop:
+            # Tables migrated by an earlier run without --drop
+            for table_name in table_names:
+                if table_name.startswith(MIGRATED_PREFIX + 'attendance_'):
+                    db.session.execute(db.text(f"DROP TABLE {preparer.quote(table_name)}"))
+                    db.session.commit()
+                    print(f"✓ Dropped {table_name}")
+
+        if not legacy_tables:
+            print("No per-student attendance tables found, nothing to migrate.")
+            return
+
+        # The old tables were created with unquoted names, which Postgres folds
+        # to lowercase, so match usernames case-insensitively
+        students = {}
+        for user in User.query.all():
+            students.setdefault(user.username.lower(), []).append(user)
+
+        for table_name in legacy_tables:
+            username = table_name[len('attendance_'):]
+            matches = students.get(username.lower(), [])
+            if not matches:
+                print(f"✗ Skipping {table_name}: no user named {username}")
+                continue
+            if len(matches) > 1:
+                names = ', '.join(user.username for user in matches)
+                print(f"✗ Skipping {table_name}: matches more than one user ({names})")
+                continue
+
+            table = preparer.quote(table_name)
+            result = db.session.execute(db.text(f"""
+                INSERT INTO attendance (student_id, date, time_in, time_out, status, created_at)
+                SELECT :student_id, date, time_in, time_out, status, created_at FROM {table}
+            """), {'student_id': matches[0].id})
+            # Retire the table in the same transaction as the copy, so a rerun can't copy it twice
+            if drop:
+                db.session.execute(db.text(f"DROP TABLE {table}"))
+            else:
+                migrated = preparer.quote(MIGRATED_PREFIX + table_name)
+                db.session.execute(db.text(f"ALTER TABLE {table} RENAME TO {migrated}"))
+            db.session.commit()
+            print(f"✓ Migrated {result.rowcount} rows from {table_name}")
+
+        if not drop:
+            print(f"\nOld tables were kept as {MIGRATED_PREFIX}attendance_*. "
+                  "Run again with --drop once the migrated data has been checked.")
+
+if __name__ == '__main__':
+    migrate_attendance_tables(drop='--drop' in sys.argv[1:])
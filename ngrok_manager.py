@@ -8,11 +8,17 @@ import requests
 import logging
 import os
 import json
-from threading import Thread
+from threading import Event, Thread
+
+from http_session import make_session
+from start_camera_proxy import PROXY_LOG
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
+# Shared HTTP session so the monitor loop and updates reuse pooled connections
+SESSION = make_session(pool_connections=10, pool_maxsize=50, backoff_factor=0.1)
+
 class NgrokManager:
     def __init__(self):
         self.ESP32_IP = os.environ.get("ESP32_IP", "192.168.29.115")
@@ -23,19 +29,22 @@ class NgrokManager:
         self.ngrok_process = None
         self.public_url = None
         self.is_running = False
+        # Set to wake the monitor early, e.g. after the stream URL changes or on stop
+        self.status_changed = Event()
     
     def start_proxy_server(self):
         """Start the camera proxy server"""
         try:
             logging.info("Starting camera proxy server...")
-            self.proxy_process = subprocess.Popen([
-                'python', 'camera_proxy.py'
-            ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            with open(PROXY_LOG, 'ab') as log_file:
+                self.proxy_process = subprocess.Popen([
+                    'python', 'camera_proxy.py'
+                ], stdout=log_file, stderr=subprocess.STDOUT)
             
             time.sleep(3)  # Give Flask time to start
             
             # Test if proxy is running
-            response = requests.get("http://localhost:8000/status", timeout=5)
+            response = SESSION.get("http://localhost:8000/status", timeout=5)
             if response.status_code == 200:
                 logging.info("Camera proxy server started successfully")
                 return True
@@ -51,9 +60,10 @@ class NgrokManager:
         """Start ngrok tunnel for the proxy server"""
         try:
             logging.info("Starting ngrok tunnel...")
+            # Tunnel details come from the ngrok API, so its output isn't needed
             self.ngrok_process = subprocess.Popen([
                 'ngrok', 'http', '8000', '--log=stdout'
-            ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             
             time.sleep(6)  # Give ngrok time to start
             
@@ -67,7 +77,7 @@ class NgrokManager:
     def get_public_url(self):
         """Get the public ngrok URL"""
         try:
-            tunnel_info = requests.get("http://127.0.0.1:4040/api/tunnels", timeout=10).json()
+            tunnel_info = SESSION.get("http://127.0.0.1:4040/api/tunnels", timeout=10).json()
             
             if tunnel_info.get('tunnels'):
                 self.public_url = tunnel_info['tunnels'][0]['public_url']
@@ -92,7 +102,7 @@ class NgrokManager:
         try:
             # Try local first
             try:
-                response = requests.post(
+                response = SESSION.post(
                     self.LOCAL_UPDATE_URL, 
                     json={"stream_url": stream_url},
                     timeout=10
@@ -100,6 +110,7 @@ class NgrokManager:
                 
                 if response.status_code == 200:
                     logging.info(f"Local Flask app updated successfully: {response.text}")
+                    self.status_changed.set()
                     return True
                 else:
                     logging.warning(f"Local Flask app responded with status {response.status_code}")
@@ -108,7 +119,7 @@ class NgrokManager:
                 logging.info("Local Flask app not accessible, trying Render...")
             
             # Try Render deployment
-            response = requests.post(
+            response = SESSION.post(
                 self.RENDER_UPDATE_URL, 
                 json={"stream_url": stream_url},
                 timeout=15
@@ -116,6 +127,7 @@ class NgrokManager:
             
             if response.status_code == 200:
                 logging.info(f"Render app updated successfully: {response.text}")
+                self.status_changed.set()
                 return True
             else:
                 logging.error(f"Render app responded with status {response.status_code}")
@@ -128,26 +140,30 @@ class NgrokManager:
     def monitor_connection(self):
         """Monitor camera connection and restart if needed"""
         while self.is_running:
+            # Sleep until the next check is due or something changed
+            self.status_changed.wait(timeout=30)
+            self.status_changed.clear()
+            if not self.is_running:
+                break
+            
             try:
                 # Check ESP32 camera
-                response = requests.get(f"http://{self.ESP32_IP}:81/", timeout=5)
+                response = SESSION.get(f"http://{self.ESP32_IP}:81/", timeout=5)
                 if response.status_code != 200:
                     logging.warning("ESP32 camera not responding properly")
                 
                 # Check proxy server
-                response = requests.get("http://localhost:8000/status", timeout=5)
+                response = SESSION.get("http://localhost:8000/status", timeout=5)
                 if response.status_code != 200:
                     logging.warning("Proxy server not responding")
                     
                 # Check ngrok tunnel
-                response = requests.get("http://127.0.0.1:4040/api/tunnels", timeout=5)
+                response = SESSION.get("http://127.0.0.1:4040/api/tunnels", timeout=5)
                 if not response.json().get('tunnels'):
                     logging.warning("Ngrok tunnel not active")
                 
             except Exception as e:
                 logging.error(f"Connection monitoring error: {e}")
-            
-            time.sleep(30)  # Check every 30 seconds
     
     def start(self):
         """Start the complete camera streaming setup"""
@@ -179,6 +195,7 @@ class NgrokManager:
     def stop(self):
         """Stop all processes"""
         self.is_running = False
+        self.status_changed.set()
         
         if self.proxy_process:
             self.proxy_process.terminate()
@@ -3,14 +3,21 @@
 Setup script to create initial admin user for UniSync
 """
 import os
-from app import app, db, User
-from werkzeug.security import generate_password_hash
+import sys
+from sqlalchemy import insert, inspect
+from app import app, db, User, hash_password
 
-def create_admin_user():
+# Precomputed hash of the default password 'admin123', made with the same argon2
+# parameters as app.password_hasher; pass --regenerate to hash it afresh
+ADMIN_HASH = '$argon2id$v=19$m=19456,t=2,p=1$40jbWKvpBfTc8UwvMAcjNA$arjs+t0z5H2gVuwn8yHPcDX+FdR5D2FDyhCcZlvaGiM'
+
+def create_admin_user(regenerate=False):
     """Create an initial admin user"""
     with app.app_context():
-        # Create all database tables
-        db.create_all()
+        # Create all database tables, unless a previous run already did
+        inspector = inspect(db.engine)
+        if not all(inspector.has_table(name) for name in db.metadata.tables):
+            db.create_all()
         
         # Check if admin user already exists
         admin_user = User.query.filter_by(username='admin').first()
@@ -18,20 +25,23 @@ def create_admin_user():
             print("Admin user already exists!")
             return
         
-        # Create admin user
-        admin = User()
-        admin.username = 'admin'
-        admin.email = 'admin@unisync.local'
-        admin.password_hash = generate_password_hash('admin123')
-        admin.role = 'admin'
-        
-        db.session.add(admin)
+        # Create admin user with a plain INSERT, no ORM unit of work needed
+        db.session.execute(insert(User).values(
+            username='admin',
+            email='admin@unisync.local',
+            password_hash=hash_password('admin123') if regenerate else ADMIN_HASH,
+            role='admin'
+        ))
         db.session.commit()
         
-        print("✓ Admin user created successfully!")
-        print("Username: admin")
-        print("Password: admin123")
-        print("\nPlease change the password after first login.")
+        sys.stdout.write("\n".join((
+            "✓ Admin user created successfully!",
+            "Username: admin",
+            "Password: admin123",
+            "",
+            "Please change the password after first login."
+        )) + "\n")
+        sys.stdout.flush()
 
 if __name__ == '__main__':
-    create_admin_user()
\ No newline at end of file
+    create_admin_user(regenerate='--regenerate' in sys.argv[1:])
\ No newline at end of file
@@ -3,103 +3,116 @@
 Camera Proxy Starter Script
 Helps start the camera proxy server and register ngrok URLs
 """
+import os
 import subprocess
 import time
 import requests
 import sys
 import argparse
 import logging
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from http_session import make_session
+
+SESSION = make_session()
+# Readiness polls must not retry, each poll is one quick connection attempt
+READY_SESSION = make_session(pool_connections=1, pool_maxsize=1, retries=0)
+
+PROXY_LOG = 'camera_proxy.log'  # Output of the proxy server process
+
+def wait_ready(url, deadline_s=5.0, interval_s=0.025):
+    """Poll url until it answers 200, giving up after deadline_s seconds"""
+    deadline = time.monotonic() + deadline_s
+    while True:
+        try:
+            # Connecting fails fast until the server listens
+            if READY_SESSION.get(url, timeout=(0.2, 1.0)).status_code == 200:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval_s)
 
 def start_proxy_server():
     """Start the camera proxy server"""
     print("Starting camera proxy server on port 8000...")
-    process = subprocess.Popen([
-        sys.executable, 'camera_proxy.py'
-    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    
-    # Wait for server to start
-    time.sleep(3)
+    # Run the proxy under its production server rather than the debug server
+    env = dict(os.environ, CAMPROXY_PROD='1')
+    # Log to a file: nobody reads a pipe, and a full pipe would block the proxy
+    with open(PROXY_LOG, 'ab') as log_file:
+        process = subprocess.Popen([
+            sys.executable, 'camera_proxy.py'
+        ], stdout=log_file, stderr=subprocess.STDOUT, env=env)
     
-    try:
-        response = requests.get("http://localhost:8000/status", timeout=5)
-        if response.status_code == 200:
-            print("✓ Camera proxy server started successfully")
-            return process
-        else:
-            print("✗ Camera proxy server failed to start properly")
-            return None
-    except Exception as e:
-        print(f"✗ Error checking proxy server: {e}")
+    # Wait for server to start; the home page answers without touching the camera
+    if wait_ready("http://localhost:8000/"):
+        print("✓ Camera proxy server started successfully")
+        return process
+    else:
+        print(f"✗ Camera proxy server failed to start properly, see {PROXY_LOG}")
         return None
 
 def register_ngrok_url(ngrok_url):
-    """Register ngrok URL with the main app"""
+    """Register ngrok URL with the main app and the proxy server"""
+    # Strip a trailing slash and /stream, in either order
+    proxy_url = ngrok_url.rstrip('/').removesuffix('/stream')
+    
+    # Both registrations are independent, so send them at the same time
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        app_future = executor.submit(SESSION.post, "http://localhost:5000/api/register_ngrok",
+                                     json={'ngrok_url': ngrok_url}, timeout=10)
+        proxy_future = executor.submit(SESSION.post, "http://localhost:8000/set_external_url",
+                                       json={'url': proxy_url}, timeout=5)
+    
     try:
-        # Register with main Flask app
-        response = requests.post("http://localhost:5000/api/register_ngrok", 
-                               json={'ngrok_url': ngrok_url}, timeout=10)
-        
+        response = app_future.result()
         if response.status_code == 200:
             data = response.json()
             print(f"✓ Ngrok URL registered with main app: {data.get('base_url')}")
         else:
             print(f"✗ Failed to register with main app: {response.text}")
-            
-        # Also register with proxy server
-        proxy_url = ngrok_url
-        if proxy_url.endswith('/stream'):
-            proxy_url = proxy_url[:-7]
-        if proxy_url.endswith('/'):
-            proxy_url = proxy_url[:-1]
-            
-        response = requests.post("http://localhost:8000/set_external_url", 
-                               json={'url': proxy_url}, timeout=5)
-        
+    except Exception as e:
+        print(f"✗ Error registering ngrok URL with main app: {e}")
+    
+    try:
+        response = proxy_future.result()
         if response.status_code == 200:
             print(f"✓ Ngrok URL registered with proxy server")
         else:
             print(f"✗ Failed to register with proxy server: {response.text}")
-            
     except Exception as e:
-        print(f"✗ Error registering ngrok URL: {e}")
+        print(f"✗ Error registering ngrok URL with proxy server: {e}")
 
 def auto_detect_ngrok():
     """Auto-detect running ngrok tunnels"""
     try:
-        response = requests.get("http://127.0.0.1:4040/api/tunnels", timeout=5)
+        response = SESSION.get("http://127.0.0.1:4040/api/tunnels", timeout=5)
         
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             tunnels = data.get('tunnels', [])
             
             if not tunnels:
                 print("No ngrok tunnels found")
                 return None
                 
+            # List the tunnels and pick the first HTTPS one in the same pass
             print("Found ngrok tunnels:")
-            for i, tunnel in enumerate(tunnels):
+            best_tunnel = None
+            for i, tunnel in enumerate(tunnels, 1):
                 proto = tunnel.get('proto', 'unknown')
-                public_url = tunnel.get('public_url', 'unknown')
                 local_url = tunnel.get('config', {}).get('addr', 'unknown')
-                print(f"  {i+1}. {proto.upper()}: {public_url} -> {local_url}")
-            
-            # Use the first HTTPS tunnel, or first tunnel if no HTTPS
-            best_tunnel = None
-            for tunnel in tunnels:
-                if tunnel.get('proto') == 'https':
+                print(f"  {i}. {proto.upper()}: {tunnel.get('public_url', 'unknown')} -> {local_url}")
+                if best_tunnel is None and proto == 'https':
                     best_tunnel = tunnel
-                    break
-            
-            if not best_tunnel and tunnels:
-                best_tunnel = tunnels[0]
             
-            if best_tunnel:
-                public_url = best_tunnel.get('public_url')
-                print(f"\nUsing: {public_url}")
-                register_ngrok_url(public_url)
-                return public_url
+            # Fall back to the first tunnel if none is HTTPS
+            public_url = (best_tunnel or tunnels[0]).get('public_url')
+            print(f"\nUsing: {public_url}")
+            register_ngrok_url(public_url)
+            return public_url
                 
         else:
             print("Could not connect to ngrok API at http://127.0.0.1:4040")
@@ -109,6 +122,11 @@ def auto_detect_ngrok():
         print(f"Error detecting ngrok tunnels: {e}")
         return None
 
+def write_lines(*lines):
+    """Print several lines with a single write"""
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
 def main():
     parser = argparse.ArgumentParser(description='Camera Proxy Management Tool')
     parser.add_argument('--start-proxy', action='store_true', help='Start the camera proxy server')
@@ -122,14 +140,14 @@ def main():
         # Start proxy server
         proxy_process = start_proxy_server()
         if proxy_process:
+            # start_proxy_server only returns once the proxy's home page answers 200, so no extra wait is needed
             print("\nAttempting to auto-detect ngrok tunnels...")
-            time.sleep(2)
             auto_detect_ngrok()
             
-            print("\n🎥 Camera proxy is running!")
-            print("   Proxy server: http://localhost:8000")
-            print("   Main app: http://localhost:5000")
-            print("\nPress Ctrl+C to stop...")
+            write_lines("\n🎥 Camera proxy is running!",
+                        "   Proxy server: http://localhost:8000",
+                        "   Main app: http://localhost:5000",
+                        "\nPress Ctrl+C to stop...")
             
             try:
                 proxy_process.wait()
@@ -140,8 +158,8 @@ def main():
     elif args.start_proxy:
         proxy_process = start_proxy_server()
         if proxy_process:
-            print("\n🎥 Camera proxy is running on http://localhost:8000")
-            print("Press Ctrl+C to stop...")
+            write_lines("\n🎥 Camera proxy is running on http://localhost:8000",
+                        "Press Ctrl+C to stop...")
             try:
                 proxy_process.wait()
             except KeyboardInterrupt:
@@ -155,14 +173,16 @@ def main():
         auto_detect_ngrok()
     
     else:
-        print("Camera Proxy Management Tool")
-        print("\nUsage:")
-        print("  python start_camera_proxy.py --all              # Start proxy + auto-detect ngrok")
-        print("  python start_camera_proxy.py --start-proxy      # Start proxy server only")
-        print("  python start_camera_proxy.py --auto-detect      # Auto-detect ngrok tunnels")
-        print("  python start_camera_proxy.py --register <url>   # Register specific ngrok URL")
-        print("\nExample:")
-        print("  python start_camera_proxy.py --register https://abc123.ngrok.io")
+        write_lines("Camera Proxy Management Tool",
+                    "\nUsage:",
+                    "  python start_camera_proxy.py --all              # Start proxy + auto-detect ngrok",
+                    "  python start_camera_proxy.py --start-proxy      # Start proxy server only",
+                    "  python start_camera_proxy.py --auto-detect      # Auto-detect ngrok tunnels",
+                    "  python start_camera_proxy.py --register <url>   # Register specific ngrok URL",
+                    "\nExample:",
+                    "  python start_camera_proxy.py --register https://abc123.ngrok.io")
 
 if __name__ == '__main__':
+    # Configured here so importing PROXY_LOG from this module leaves logging alone
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     main()
\ No newline at end of file